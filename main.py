@@ -11,7 +11,16 @@ import sys
 import logging
 import argparse
 
-from src.conversion import extract_timing_points, convert_to_clone_hero_format, generate_clone_hero_output
+from src.conversion import (
+    read_osu_file,
+    parse_timing_points,
+    convert_to_clone_hero_format,
+    remove_redundant_timing_points,
+    generate_clone_hero_output,
+    read_chart_resolution,
+    merge_sync_track,
+)
+from src.profiling import StageProfiler, DEFAULT_TOP_ALLOCATIONS
 
 DEFAULT_TICK_RATE = 192
 DEFAULT_INPUT_FILE = "example_beatmap.osu"
@@ -50,6 +59,16 @@ def setup_parser() -> argparse.Namespace:
         dest="output_file",
         help="Path to save the output file (if not specified, output to terminal only)",
     )
+    parser.add_argument(
+        "-m",
+        "--merge",
+        dest="merge_chart",
+        metavar="CHART_FILE",
+        help=(
+            "Replace the [SyncTrack] section of an existing .chart file, keeping every other section"
+            " (saved to the output file if specified, otherwise the chart file is updated in place)"
+        ),
+    )
     parser.add_argument(
         "-t",
         "--tick-rate",
@@ -58,7 +77,35 @@ def setup_parser() -> argparse.Namespace:
         default=DEFAULT_TICK_RATE,
         help=f"Clone Hero tick rate (default: {DEFAULT_TICK_RATE})",
     )
+    parser.add_argument(
+        "-r",
+        "--remove-redundant",
+        dest="remove_redundant",
+        action="store_true",
+        help="Remove timing points that change neither BPM nor time signature",
+    )
     parser.add_argument("-d", "--debug", action="store_true", help="Enable debug logging")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print wall time, CPU time and peak memory of each conversion stage",
+    )
+    parser.add_argument(
+        "--profile-stats",
+        dest="profile_stats",
+        metavar="PSTATS_FILE",
+        help="Save cProfile statistics to this .pstats file (implies --profile)",
+    )
+    parser.add_argument(
+        "--profile-top",
+        dest="profile_top",
+        type=int,
+        metavar="N",
+        help=(
+            "Number of top allocation sites to print, 0 to disable"
+            f" (default: {DEFAULT_TOP_ALLOCATIONS}, implies --profile)"
+        ),
+    )
 
     return parser.parse_args()
 
@@ -83,17 +130,49 @@ def main() -> None:
     args = setup_parser()
     setup_logging(args.debug)
 
-    logger.info(f"Converting {args.input_file}")
-    timing_points = extract_timing_points(args.input_file)
-    logger.debug(f"Found {len(timing_points)} timing points")
-    ch_timing_lines = convert_to_clone_hero_format(timing_points, args.tick_rate)
-    output = generate_clone_hero_output(ch_timing_lines)
+    # Asking for profiling output turns profiling on
+    profiling = args.profile or bool(args.profile_stats) or args.profile_top is not None
+    top_allocations = args.profile_top if args.profile_top is not None else DEFAULT_TOP_ALLOCATIONS
+    profiler = StageProfiler(profiling, args.profile_stats, top_allocations)
 
-    if args.output_file:
-        write_clone_hero_file(output, args.output_file)
-        logger.info(f"Conversion complete. Output saved to {args.output_file}")
-    else:
-        print("\n" + output)
+    tick_rate = args.tick_rate
+    if args.merge_chart:
+        # The timing must use the resolution of the chart the notes were placed with
+        resolution = read_chart_resolution(args.merge_chart)
+        if resolution and resolution != tick_rate:
+            logger.info(f"Using the chart resolution {resolution} as tick rate")
+            tick_rate = resolution
+
+    profiler.start()
+
+    # Report even if the conversion fails, problem beatmaps are what profiling is for
+    try:
+        logger.info(f"Converting {args.input_file}")
+        with profiler.stage("read"):
+            content = read_osu_file(args.input_file)
+        with profiler.stage("extract"):
+            timing_points = parse_timing_points(content)
+        logger.debug(f"Found {len(timing_points)} timing points")
+        with profiler.stage("convert"):
+            ch_timing_lines = convert_to_clone_hero_format(timing_points, tick_rate)
+            if args.remove_redundant:
+                ch_timing_lines = remove_redundant_timing_points(ch_timing_lines)
+        with profiler.stage("render"):
+            output = generate_clone_hero_output(ch_timing_lines, skip_unchanged_signatures=args.remove_redundant)
+
+        with profiler.stage("write"):
+            if args.merge_chart:
+                output_file = args.output_file or args.merge_chart
+                merge_sync_track(args.merge_chart, output, output_file)
+                logger.info(f"Merge complete. Chart saved to {output_file}")
+            elif args.output_file:
+                write_clone_hero_file(output, args.output_file)
+                logger.info(f"Conversion complete. Output saved to {args.output_file}")
+            else:
+                print("\n" + output)
+    finally:
+        profiler.stop()
+        profiler.report()
 
 
 if __name__ == "__main__":
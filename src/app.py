@@ -9,7 +9,6 @@ to Clone Hero chart format.
 
 import os
 import re
-import requests
 import zipfile
 import io
 import logging
@@ -19,7 +18,14 @@ import time
 
 from flask import Flask, render_template, request, flash, redirect, url_for, send_file, session
 
-from conversion import extract_timing_points, convert_to_clone_hero_format, generate_clone_hero_output
+from conversion import (
+    extract_timing_points,
+    convert_to_clone_hero_format,
+    remove_redundant_timing_points,
+    generate_clone_hero_output,
+)
+from audio_store import AudioStore
+from mirrors import MirrorManager
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
@@ -28,6 +34,10 @@ logger = logging.getLogger(__name__)
 # Constants
 OSU_BEATMAP_URL_PATTERN = r"https?://osu\.ppy\.sh/beatmapsets/(\d+)(?:#.+)?"
 BEATCONNECT_URL_PATTERN = r"https?://beatconnect\.io/b/(\d+)(?:/?.*)?"
+AUDIO_BLOB_FOLDER = "blobs"
+AUDIO_REF_FILENAME = "audio.ref"
+SESSION_MAX_AGE = 3600  # 1 hour
+CLEANUP_INTERVAL = 300  # 5 minutes
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY", os.urandom(24))
@@ -38,14 +48,27 @@ if os.environ.get("VERCEL", False):
     temp_base_dir = tempfile.mkdtemp()
     app.config["UPLOAD_FOLDER"] = temp_base_dir
 else:
-    # In development, use a persistent folder
-    app.config["UPLOAD_FOLDER"] = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
+    # In development, use a persistent folder (can be overridden, e.g. by the load test)
+    app.config["UPLOAD_FOLDER"] = os.environ.get("UPLOAD_FOLDER") or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "uploads"
+    )
     # Ensure the upload directory exists
     os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
 
-# Store audio file data in session for Vercel environment
+# Store session data in memory for Vercel environment
 session_files = {}
 
+# Audio is stored once per distinct content; sessions only keep its hash
+if os.environ.get("VERCEL", False):
+    audio_store = AudioStore()
+else:
+    audio_store = AudioStore(os.path.join(app.config["UPLOAD_FOLDER"], AUDIO_BLOB_FOLDER))
+
+last_cleanup_time = 0.0
+
+# Beatmap mirrors, tried in order of observed latency and reliability
+mirror_manager = MirrorManager.from_environment()
+
 
 @app.route("/")
 def index():
@@ -56,7 +79,10 @@ def index():
 @app.route("/convert", methods=["POST"])
 def convert():
     """Process the beatmap link and convert timing points."""
+    maybe_cleanup_old_files()
+
     beatmap_url = request.form.get("beatmap_url", "").strip()
+    remove_redundant = bool(request.form.get("remove_redundant"))
 
     if not beatmap_url:
         flash("Please enter a beatmap URL")
@@ -72,13 +98,8 @@ def convert():
         flash("Invalid beatmap URL. Please use a URL from osu! or beatconnect.io")
         return redirect(url_for("index"))
 
-    fallback_url = f"https://beatconnect.io/b/{beatmap_id}"
-    download_url = f"https://api.nerinyan.moe/d/{beatmap_id}"
-
     try:
         # Download the beatmap
-        logger.info(f"Downloading beatmap from {download_url}")
-
         # osu! website requires a user agent and referer to be set
         headers = {
             "User-Agent": (
@@ -88,12 +109,8 @@ def convert():
             "Referer": f"https://osu.ppy.sh/beatmapsets/{beatmap_id}",
         }
 
-        response = requests.get(download_url, headers=headers, stream=True)
-
-        # If the beatmap is not found, try the fallback URL
-        if response.status_code != 200:
-            logger.info(f"Beatmap not found at {download_url}, trying fallback URL {fallback_url}")
-            response = requests.get(fallback_url, headers=headers, stream=True)
+        # Mirrors are tried from the best performing one, falling back to the others
+        response = mirror_manager.download(beatmap_id, headers)
 
         if response.status_code == 404:
             flash("Beatmap not found")
@@ -162,22 +179,23 @@ def convert():
             if audio_filename and os.path.exists(os.path.join(temp_dir, audio_filename)):
                 audio_src_path = os.path.join(temp_dir, audio_filename)
 
+                # The audio itself is deduplicated in the store; sessions keep its hash
+                audio_hash = audio_store.add(audio_src_path)
+
                 # For Vercel: store in memory
                 if os.environ.get("VERCEL", False):
-                    with open(audio_src_path, "rb") as audio_file:
-                        audio_data = audio_file.read()
-                        session_files[session_id] = {
-                            "filename": audio_filename,
-                            "data": audio_data,
-                            "timestamp": time.time(),
-                            "beatmap_info": beatmap_info,
-                        }
+                    session_files[session_id] = {
+                        "filename": audio_filename,
+                        "audio_hash": audio_hash,
+                        "timestamp": time.time(),
+                        "beatmap_info": beatmap_info,
+                    }
                 else:
                     # For local: store in uploads directory
                     session_dir = os.path.join(app.config["UPLOAD_FOLDER"], session_id)
                     os.makedirs(session_dir, exist_ok=True)
-                    audio_dest_path = os.path.join(session_dir, audio_filename)
-                    shutil.copy2(audio_src_path, audio_dest_path)
+                    with open(os.path.join(session_dir, AUDIO_REF_FILENAME), "w", encoding="utf-8") as f:
+                        f.write(audio_hash)
 
                     # Save beatmap info for later use
                     import json
@@ -195,10 +213,14 @@ def convert():
                 logger.info(f"Found {len(timing_points)} timing points")
 
                 ch_timing_lines = convert_to_clone_hero_format(timing_points)
-                ch_output = generate_clone_hero_output(ch_timing_lines)
+                if remove_redundant:
+                    ch_timing_lines = remove_redundant_timing_points(ch_timing_lines)
+                ch_output = generate_clone_hero_output(ch_timing_lines, skip_unchanged_signatures=remove_redundant)
 
                 # Store the chart data in the session for download
-                full_chart_content = generate_complete_chart(beatmap_info, audio_filename, ch_timing_lines)
+                full_chart_content = generate_complete_chart(
+                    beatmap_info, audio_filename, ch_timing_lines, skip_unchanged_signatures=remove_redundant
+                )
 
                 if os.environ.get("VERCEL", False):
                     if session_id in session_files:
@@ -229,7 +251,7 @@ def convert():
         return redirect(url_for("index"))
 
 
-def generate_complete_chart(beatmap_info, audio_filename, ch_timing_lines):
+def generate_complete_chart(beatmap_info, audio_filename, ch_timing_lines, skip_unchanged_signatures=False):
     """Generate a complete .chart file with beatmap info and timings."""
     # Default values
     title = beatmap_info.get("title", "Unknown Title")
@@ -279,8 +301,11 @@ def generate_complete_chart(beatmap_info, audio_filename, ch_timing_lines):
     chart_content.append("{")
 
     # Add the timing points from the processed data
+    last_signature = None
     for ticks, bpm, signature, _ in ch_timing_lines:
-        chart_content.append(f"  {ticks} = TS {signature}")
+        if not skip_unchanged_signatures or signature != last_signature:
+            chart_content.append(f"  {ticks} = TS {signature}")
+        last_signature = signature
         chart_content.append(f"  {ticks} = B {int(bpm)}000")
 
     chart_content.append("}")
@@ -309,9 +334,11 @@ def download_audio():
 
     # Check if we're using in-memory storage (Vercel)
     if os.environ.get("VERCEL", False):
-        if session_id in session_files and "data" in session_files[session_id]:
-            audio_data = session_files[session_id]["data"]
+        audio_data = None
+        if session_id in session_files and "audio_hash" in session_files[session_id]:
+            audio_data = audio_store.data(session_files[session_id]["audio_hash"])
 
+        if audio_data is not None:
             # Get metadata for filename if available
             if "beatmap_info" in session_files[session_id]:
                 info = session_files[session_id]["beatmap_info"]
@@ -342,14 +369,15 @@ def download_audio():
             return redirect(url_for("index"))
     else:
         # Using file system storage
-        audio_path = os.path.join(app.config["UPLOAD_FOLDER"], session_id, audio_filename)
+        session_dir = os.path.join(app.config["UPLOAD_FOLDER"], session_id)
+        audio_hash = read_audio_ref(session_dir)
+        audio_path = audio_store.path(audio_hash) if audio_hash else None
 
-        if not os.path.exists(audio_path):
+        if not audio_path:
             flash("Audio file not found")
             return redirect(url_for("index"))
 
         # Get session data for filename
-        session_dir = os.path.join(app.config["UPLOAD_FOLDER"], session_id)
         info_path = os.path.join(session_dir, "beatmap_info.json")
         if os.path.exists(info_path):
             try:
@@ -470,37 +498,76 @@ def download_chart():
         return send_file(chart_path, as_attachment=True, download_name=chart_filename)
 
 
-# Cleanup function to remove old files (only needed for local development)
+def read_audio_ref(session_dir):
+    """Read the hash of the audio referenced by a local session, if any."""
+    try:
+        with open(os.path.join(session_dir, AUDIO_REF_FILENAME), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def maybe_cleanup_old_files():
+    """Run cleanup_old_files at most once every CLEANUP_INTERVAL seconds."""
+    global last_cleanup_time
+
+    current_time = time.time()
+    if current_time - last_cleanup_time < CLEANUP_INTERVAL:
+        return
+    last_cleanup_time = current_time
+
+    try:
+        cleanup_old_files()
+    except Exception as e:
+        logger.error(f"Error cleaning up old files: {str(e)}")
+
+
+# Cleanup function to remove old sessions and unreferenced audio
 def cleanup_old_files():
-    """Clean up files older than 1 hour"""
+    """Clean up sessions older than 1 hour and the audio no session references anymore"""
+    current_time = time.time()
+
     if os.environ.get("VERCEL", False):
         # On Vercel, cleanup temp files from memory
-        current_time = time.time()
         to_remove = []
         for session_id, file_info in session_files.items():
-            if "timestamp" in file_info and current_time - file_info["timestamp"] > 3600:
+            if "timestamp" in file_info and current_time - file_info["timestamp"] > SESSION_MAX_AGE:
                 to_remove.append(session_id)
 
         for session_id in to_remove:
-            del session_files[session_id]
+            audio_hash = session_files.pop(session_id).get("audio_hash")
+            if audio_hash:
+                audio_store.release(audio_hash)
 
+        audio_store.collect_garbage()
         return
 
-    import time
-
-    current_time = time.time()
     uploads_folder = app.config["UPLOAD_FOLDER"]
+    live_hashes = set()
 
     for session_folder in os.listdir(uploads_folder):
         session_path = os.path.join(uploads_folder, session_folder)
-        if os.path.isdir(session_path):
-            # If folder is older than 1 hour
-            if current_time - os.path.getctime(session_path) > 3600:
-                try:
-                    shutil.rmtree(session_path)
-                    logger.info(f"Cleaned up old session folder: {session_folder}")
-                except Exception as e:
-                    logger.error(f"Error cleaning up folder {session_folder}: {str(e)}")
+        if session_folder == AUDIO_BLOB_FOLDER or not os.path.isdir(session_path):
+            continue
+
+        audio_hash = read_audio_ref(session_path)
+
+        # If folder is older than 1 hour
+        if current_time - os.path.getctime(session_path) > SESSION_MAX_AGE:
+            try:
+                shutil.rmtree(session_path)
+                if audio_hash:
+                    audio_store.release(audio_hash)
+                logger.info(f"Cleaned up old session folder: {session_folder}")
+            except Exception as e:
+                logger.error(f"Error cleaning up folder {session_folder}: {str(e)}")
+                if audio_hash:
+                    live_hashes.add(audio_hash)
+        elif audio_hash:
+            live_hashes.add(audio_hash)
+
+    # Blobs are shared between sessions, so only collect those no session references
+    audio_store.collect_garbage(live_hashes)
 
 
 if __name__ == "__main__":
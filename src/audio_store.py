@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Beatmap to Chart Converter - Audio Storage
+
+This module stores extracted beatmap audio files once per distinct content.
+Audio is addressed by the SHA-256 hash of its bytes, and conversion sessions only
+keep a reference to that hash, so converting the same beatmap many times does
+not duplicate the audio in memory or on disk.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+# Constants
+HASH_CHUNK_SIZE = 1024 * 1024  # 1MB
+BLOB_GRACE_PERIOD = 300  # seconds an unreferenced blob is kept before collection
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+def hash_file(file_path: str) -> str:
+    """Compute the SHA-256 hash of a file without loading it into memory.
+
+    Args:
+        file_path: Path to the file to hash
+
+    Returns:
+        Hexadecimal SHA-256 digest of the file content
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AudioStore:
+    """Reference-counted, content-addressed storage for audio files.
+
+    When a root directory is given, blobs are stored as files named after their
+    hash inside it. Otherwise blobs are kept in memory (used on Vercel, where the
+    filesystem is not shared between invocations).
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        """Create a new audio store.
+
+        Args:
+            root: Directory to store blobs in, or None to keep blobs in memory
+        """
+        self.root = root
+        self._blobs: Dict[str, bytes] = {}
+        self._refs: Dict[str, int] = {}
+        self._released: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+        if self.root:
+            os.makedirs(self.root, exist_ok=True)
+
+    def add(self, file_path: str) -> str:
+        """Store a file and take a reference to it.
+
+        The file content is only copied if no blob with the same hash exists yet.
+
+        Args:
+            file_path: Path to the audio file to store
+
+        Returns:
+            Hash of the stored blob, to be passed to release() when no longer needed
+        """
+        digest = hash_file(file_path)
+
+        with self._lock:
+            if not self._has_blob(digest):
+                self._write_blob(digest, file_path)
+                logger.info(f"Stored new audio blob {digest}")
+            else:
+                logger.debug(f"Reusing existing audio blob {digest}")
+                if self.root:
+                    # Refresh the blob age so other processes don't collect it mid-use
+                    os.utime(os.path.join(self.root, digest))
+
+            self._refs[digest] = self._refs.get(digest, 0) + 1
+            self._released.pop(digest, None)
+
+        return digest
+
+    def release(self, digest: str) -> None:
+        """Drop a reference to a blob.
+
+        Unreferenced blobs are deleted by collect_garbage() once the grace period
+        has passed, so a popular song released and re-added shortly after is kept.
+
+        Args:
+            digest: Hash of the blob, as returned by add()
+        """
+        with self._lock:
+            count = self._refs.get(digest, 0) - 1
+            if count > 0:
+                self._refs[digest] = count
+            else:
+                self._refs.pop(digest, None)
+                self._released[digest] = time.time()
+
+    def path(self, digest: str) -> Optional[str]:
+        """Get the path of a blob stored on disk.
+
+        Args:
+            digest: Hash of the blob
+
+        Returns:
+            Path to the blob file, or None if the store is in memory or the blob is missing
+        """
+        if not self.root:
+            return None
+        blob_path = os.path.join(self.root, digest)
+        return blob_path if os.path.exists(blob_path) else None
+
+    def data(self, digest: str) -> Optional[bytes]:
+        """Get the content of a blob.
+
+        Args:
+            digest: Hash of the blob
+
+        Returns:
+            Content of the blob, or None if it is missing
+        """
+        if not self.root:
+            return self._blobs.get(digest)
+
+        blob_path = self.path(digest)
+        if blob_path is None:
+            return None
+        with open(blob_path, "rb") as file:
+            return file.read()
+
+    def collect_garbage(self, live: Optional[Iterable[str]] = None) -> int:
+        """Delete blobs that are no longer referenced.
+
+        Args:
+            live: Hashes known to be referenced by existing sessions. On disk, blobs
+                not in this set and not referenced in this process are collected
+                too, which reclaims blobs left over by a previous process.
+
+        Returns:
+            Number of blobs deleted
+        """
+        current_time = time.time()
+        scan_orphans = live is not None
+        live = set(live or ())
+        removed = 0
+
+        with self._lock:
+            if self.root and scan_orphans:
+                for digest in os.listdir(self.root):
+                    if digest.startswith(".") or digest in self._refs or digest in live or digest in self._released:
+                        continue
+                    # Blobs from a previous process: use the file age as release time
+                    self._released[digest] = os.path.getmtime(os.path.join(self.root, digest))
+
+            for digest, released_at in list(self._released.items()):
+                if self.root:
+                    # Another process may have reused the blob since, which refreshes its age
+                    try:
+                        released_at = max(released_at, os.path.getmtime(os.path.join(self.root, digest)))
+                    except FileNotFoundError:
+                        del self._released[digest]
+                        continue
+                if digest in live or current_time - released_at <= BLOB_GRACE_PERIOD:
+                    continue
+                self._delete_blob(digest)
+                del self._released[digest]
+                removed += 1
+                logger.info(f"Collected unreferenced audio blob {digest}")
+
+        return removed
+
+    def _has_blob(self, digest: str) -> bool:
+        if self.root:
+            return os.path.exists(os.path.join(self.root, digest))
+        return digest in self._blobs
+
+    def _write_blob(self, digest: str, file_path: str) -> None:
+        if not self.root:
+            with open(file_path, "rb") as file:
+                self._blobs[digest] = file.read()
+            return
+
+        # Copy to a temporary file first so a blob is never visible half-written
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as temp_file, open(file_path, "rb") as source:
+                shutil.copyfileobj(source, temp_file, HASH_CHUNK_SIZE)
+            os.replace(temp_path, os.path.join(self.root, digest))
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+    def _delete_blob(self, digest: str) -> None:
+        if not self.root:
+            self._blobs.pop(digest, None)
+            return
+
+        try:
+            os.remove(os.path.join(self.root, digest))
+        except FileNotFoundError:
+            pass
@@ -7,12 +7,19 @@ to Clone Hero format, extracted from the main.py script for use in the web appli
 """
 
 import logging
-from typing import List, Tuple
+import os
+import re
+import shutil
+import tempfile
+from typing import List, Optional, Tuple
 
 # Constants
 DEFAULT_TICK_RATE = 192
 DEFAULT_BPM = 120
 DEFAULT_TIME_SIGNATURE = 4
+SONG_SECTION = "[Song]"
+SYNC_TRACK_SECTION = "[SyncTrack]"
+CHART_RESOLUTION_PATTERN = r"^\s*Resolution\s*=\s*(\d+)\s*$"
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -33,12 +40,42 @@ def extract_timing_points(osu_file_path: str) -> List[str]:
         FileNotFoundError: If the input file doesn't exist
         ValueError: If the file doesn't contain timing points section
     """
+    return parse_timing_points(read_osu_file(osu_file_path))
+
+
+def read_osu_file(osu_file_path: str) -> str:
+    """Read the content of an osu! beatmap file.
+
+    Args:
+        osu_file_path: Path to the osu! beatmap file
+
+    Returns:
+        Content of the file
+
+    Raises:
+        FileNotFoundError: If the input file doesn't exist
+    """
     try:
         with open(osu_file_path, "r", encoding="utf-8") as file:
-            content = file.read()
+            return file.read()
     except FileNotFoundError:
         raise FileNotFoundError(f"Input file '{osu_file_path}' not found")
 
+
+def parse_timing_points(content: str) -> List[str]:
+    """Extract timing points from the content of an osu! beatmap file.
+
+    Only extracts timing points that are actual BPM changes (not inherited points).
+
+    Args:
+        content: Content of the osu! beatmap file
+
+    Returns:
+        List of timing point lines
+
+    Raises:
+        ValueError: If the content doesn't contain timing points section
+    """
     try:
         timing_section_parts = content.split("[TimingPoint")
         if len(timing_section_parts) < 2:
@@ -122,7 +159,43 @@ def convert_to_clone_hero_format(
     return ch_timing_lines
 
 
-def generate_clone_hero_output(ch_timing_lines: List[Tuple[int, int, int, float]]) -> str:
+def remove_redundant_timing_points(
+    ch_timing_lines: List[Tuple[int, int, int, float]]
+) -> List[Tuple[int, int, int, float]]:
+    """Remove Clone Hero timing points that change neither BPM nor time signature.
+
+    osu! beatmaps often repeat uninherited timing points with the same BPM and meter
+    to reset hitsounds or the metronome; these are useless in a SyncTrack.
+    When several timing points share the same tick, only the last one is kept.
+
+    Args:
+        ch_timing_lines: List of Clone Hero timing points
+
+    Returns:
+        List of Clone Hero timing points without redundant entries
+    """
+    simplified = []
+
+    for point in ch_timing_lines:
+        ticks, bpm, signature, _ = point
+
+        # A later timing point on the same tick overrides the previous one
+        if simplified and simplified[-1][0] == ticks:
+            simplified.pop()
+
+        if simplified and simplified[-1][1] == bpm and simplified[-1][2] == signature:
+            continue
+
+        simplified.append(point)
+
+    logger.debug(f"Removed {len(ch_timing_lines) - len(simplified)} redundant timing points")
+
+    return simplified
+
+
+def generate_clone_hero_output(
+    ch_timing_lines: List[Tuple[int, int, int, float]], skip_unchanged_signatures: bool = False
+) -> str:
     """Generate timing points in Clone Hero format as a string.
 
     Format:
@@ -131,17 +204,21 @@ def generate_clone_hero_output(ch_timing_lines: List[Tuple[int, int, int, float]
 
     Args:
         ch_timing_lines: List of Clone Hero timing points
+        skip_unchanged_signatures: Only emit a TS line when the time signature changes
 
     Returns:
         String containing formatted Clone Hero timing data
     """
     lines = [
-        "[SyncTrack]",
+        SYNC_TRACK_SECTION,
         "{",
     ]
 
+    last_signature = None
     for ticks, bpm, signature, _ in ch_timing_lines:
-        lines.append(f"  {ticks} = TS {signature}")
+        if not skip_unchanged_signatures or signature != last_signature:
+            lines.append(f"  {ticks} = TS {signature}")
+        last_signature = signature
 
         # Convert BPM to the format expected by Clone Hero
         # For example, 120 BPM becomes 120000, 234.23 BPM becomes 234230
@@ -158,3 +235,136 @@ def generate_clone_hero_output(ch_timing_lines: List[Tuple[int, int, int, float]
     lines.append("}")
 
     return "\n".join(lines)
+
+
+def _open_chart(chart_file_path: str, mode: str):
+    """Open a .chart file so that any content, including line endings, round-trips verbatim."""
+    return open(chart_file_path, mode, encoding="utf-8", errors="surrogateescape", newline="")
+
+
+def _current_umask() -> int:
+    """Get the file mode creation mask of the process."""
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def _section_name(line: str) -> str:
+    """Get the section header of a .chart line, ignoring whitespace and a UTF-8 BOM."""
+    return line.strip().lstrip("\ufeff")
+
+
+def read_chart_resolution(chart_file_path: str) -> Optional[int]:
+    """Read the Resolution of an existing .chart file.
+
+    Only the [Song] section is read, so this stays cheap on large charts.
+
+    Args:
+        chart_file_path: Path to the .chart file
+
+    Returns:
+        The chart resolution (ticks per beat), or None if it isn't set
+
+    Raises:
+        FileNotFoundError: If the chart file doesn't exist
+    """
+    try:
+        with _open_chart(chart_file_path, "r") as file:
+            in_song = False
+            for line in file:
+                name = _section_name(line)
+                if name.startswith("["):
+                    if in_song:
+                        break
+                    in_song = name == SONG_SECTION
+                elif in_song and (match := re.match(CHART_RESOLUTION_PATTERN, line)):
+                    return int(match.group(1))
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Chart file '{chart_file_path}' not found")
+
+    return None
+
+
+def merge_sync_track(chart_file_path: str, sync_track: str, output_file_path: str) -> None:
+    """Replace the [SyncTrack] section of an existing .chart file.
+
+    The chart is streamed line by line: every other section is copied verbatim without
+    being parsed, and the output file is replaced atomically once fully written, so the
+    output may be the chart file itself. If the chart has no [SyncTrack] section, it is
+    inserted after the [Song] section (or at the end of the file if there is none).
+
+    Args:
+        chart_file_path: Path to the existing .chart file
+        sync_track: SyncTrack section, as returned by generate_clone_hero_output
+        output_file_path: Path to save the merged .chart file to
+
+    Raises:
+        FileNotFoundError: If the chart file doesn't exist
+        ValueError: If the [SyncTrack] section of the chart is not closed
+    """
+    # Open the chart first, so a missing chart doesn't leave a temporary file behind
+    try:
+        source = _open_chart(chart_file_path, "r")
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Chart file '{chart_file_path}' not found")
+
+    with source:
+        output_dir = os.path.dirname(os.path.abspath(output_file_path))
+        fd, temp_path = tempfile.mkstemp(dir=output_dir, prefix=".tmp-", suffix=".chart")
+
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8", errors="surrogateescape", newline="") as output:
+                newline = "\n"
+                line = ""
+                section = None
+                skipping = False
+                merged = False
+
+                for line in source:
+                    if line.endswith("\r\n"):
+                        newline = "\r\n"
+                    name = _section_name(line)
+
+                    if skipping:
+                        # Drop the old SyncTrack content up to and including its closing brace
+                        if name == "}":
+                            skipping = False
+                        continue
+
+                    if name.startswith("["):
+                        if section == SONG_SECTION and not merged and name != SYNC_TRACK_SECTION:
+                            output.write(sync_track.replace("\n", newline) + newline)
+                            merged = True
+                        section = name
+
+                    if name == SYNC_TRACK_SECTION:
+                        if not merged:
+                            # Keep a BOM or indentation that precedes the header
+                            output.write(line[: line.index("[")])
+                            output.write(sync_track.replace("\n", newline) + newline)
+                            merged = True
+                        skipping = True
+                        continue
+
+                    output.write(line)
+
+                if skipping:
+                    raise ValueError(f"Unclosed {SYNC_TRACK_SECTION} section in '{chart_file_path}'")
+
+                if not merged:
+                    if line and not line.endswith("\n"):
+                        output.write(newline)
+                    output.write(sync_track.replace("\n", newline) + newline)
+
+                output.flush()
+                os.fsync(output.fileno())
+
+            # mkstemp creates the file readable by its owner only
+            if os.path.exists(output_file_path):
+                shutil.copymode(output_file_path, temp_path)
+            else:
+                os.chmod(temp_path, 0o666 & ~_current_umask())
+            os.replace(temp_path, output_file_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
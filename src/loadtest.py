@@ -0,0 +1,575 @@
+#!/usr/bin/env python3
+"""
+Beatmap to Chart Converter - Load Test
+
+This script measures how the web application scales with concurrent users. It starts
+a local stand-in beatmap mirror serving fixture .osz files with configurable latency
+and bandwidth, starts the application pointed at that mirror, and drives the
+/convert, /download_chart and /download_audio endpoints at increasing concurrency.
+
+For each concurrency level it reports throughput, p50/p95/p99 latency, errors, peak
+RSS of the application and peak disk usage of its temporary and upload folders.
+"""
+
+import argparse
+import io
+import json
+import logging
+import math
+import os
+import random
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+# Constants
+DEFAULT_LEVELS = "1,2,4,8,16"
+DEFAULT_FLOWS_PER_USER = 5
+DEFAULT_AUDIO_SIZE_MB = 8
+DEFAULT_FIXTURE_COUNT = 1
+DEFAULT_SERVER_COMMAND = (
+    f"{shlex.quote(sys.executable)} -c "
+    "\"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)\""
+)
+EXAMPLE_BEATMAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "example_beatmap.osu")
+MIRROR_CHUNK_SIZE = 64 * 1024
+SAMPLE_INTERVAL = 0.1  # seconds
+SERVER_START_TIMEOUT = 30  # seconds
+REQUEST_TIMEOUT = 120  # seconds
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+def setup_logging(debug_mode: bool) -> None:
+    """Configure the logging level based on the debug mode.
+
+    Args:
+        debug_mode: Whether to show debug logs
+    """
+    if debug_mode:
+        logging.basicConfig(level=logging.DEBUG, format="%(levelname)s: %(message)s")
+    else:
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+
+def setup_parser() -> argparse.Namespace:
+    """Set up and configure the argument parser for command line arguments.
+
+    Returns:
+        argparse.Namespace: Parsed command line arguments
+    """
+    parser = argparse.ArgumentParser(description="Load test the Beatmap to Chart web application")
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        dest="levels",
+        default=DEFAULT_LEVELS,
+        help=f"Comma-separated numbers of concurrent users to test (default: {DEFAULT_LEVELS})",
+    )
+    parser.add_argument(
+        "-n",
+        "--flows-per-user",
+        dest="flows_per_user",
+        type=int,
+        default=DEFAULT_FLOWS_PER_USER,
+        help=f"Convert and download flows run by each user at each level (default: {DEFAULT_FLOWS_PER_USER})",
+    )
+    parser.add_argument(
+        "-f",
+        "--fixtures",
+        dest="fixtures_dir",
+        help="Directory of .osz files to serve, named after their beatmap set id (default: generated fixtures)",
+    )
+    parser.add_argument(
+        "--fixture-count",
+        dest="fixture_count",
+        type=int,
+        default=DEFAULT_FIXTURE_COUNT,
+        help=f"Number of distinct beatmaps to generate without --fixtures (default: {DEFAULT_FIXTURE_COUNT})",
+    )
+    parser.add_argument(
+        "--audio-size",
+        dest="audio_size",
+        type=float,
+        default=DEFAULT_AUDIO_SIZE_MB,
+        help=f"Audio size of the generated fixtures, in MB (default: {DEFAULT_AUDIO_SIZE_MB})",
+    )
+    parser.add_argument(
+        "--mirror-latency",
+        dest="mirror_latency",
+        type=float,
+        default=0,
+        help="Delay before the stand-in mirror answers, in milliseconds (default: 0)",
+    )
+    parser.add_argument(
+        "--mirror-bandwidth",
+        dest="mirror_bandwidth",
+        type=float,
+        default=0,
+        help="Bandwidth of the stand-in mirror per download, in KiB/s (default: 0, unlimited)",
+    )
+    parser.add_argument(
+        "--mirror-failure-rate",
+        dest="mirror_failure_rate",
+        type=float,
+        default=0,
+        help="Fraction of requests the stand-in mirror fails, between 0 and 1 (default: 0)",
+    )
+    parser.add_argument(
+        "--mirror-failure-status",
+        dest="mirror_failure_status",
+        type=int,
+        default=500,
+        help="HTTP status of failed mirror requests, or 0 to drop the connection (default: 500)",
+    )
+    parser.add_argument(
+        "--server-command",
+        dest="server_command",
+        default=DEFAULT_SERVER_COMMAND,
+        help="Command starting the application from the src folder, with {port} placeholder"
+        " (default: Flask threaded server, e.g. use 'gunicorn -w 4 -b 127.0.0.1:{port} app:app')",
+    )
+    parser.add_argument("-o", "--output", dest="output_file", help="Path to save the results as JSON")
+    parser.add_argument(
+        "--fail-p99",
+        dest="fail_p99",
+        type=float,
+        help="Exit with an error if the p99 latency of any level exceeds this value, in milliseconds",
+    )
+    parser.add_argument("-d", "--debug", action="store_true", help="Enable debug logging")
+
+    return parser.parse_args()
+
+
+def generate_fixture(audio_size: float) -> bytes:
+    """Generate a .osz file containing the example beatmap and random audio.
+
+    Args:
+        audio_size: Size of the audio file, in MB
+
+    Returns:
+        Content of the .osz file
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as osz:
+        osz.write(EXAMPLE_BEATMAP, "beatmap.osu")
+        # The example beatmap references audio.mp3
+        osz.writestr("audio.mp3", os.urandom(int(audio_size * 1024 * 1024)))
+    return buffer.getvalue()
+
+
+def load_fixtures(fixtures_dir: Optional[str], fixture_count: int, audio_size: float) -> Dict[str, bytes]:
+    """Load the .osz files served by the stand-in mirror.
+
+    Args:
+        fixtures_dir: Directory of .osz files named after their beatmap set id, or None
+        fixture_count: Number of fixtures to generate when no directory is given
+        audio_size: Audio size of the generated fixtures, in MB
+
+    Returns:
+        Dictionary of beatmap set id to .osz content
+
+    Raises:
+        ValueError: If the fixtures directory contains no usable .osz file
+    """
+    if not fixtures_dir:
+        return {str(i + 1): generate_fixture(audio_size) for i in range(fixture_count)}
+
+    fixtures = {}
+    for filename in sorted(os.listdir(fixtures_dir)):
+        beatmap_id, ext = os.path.splitext(filename)
+        if ext == ".osz" and beatmap_id.isdigit():
+            with open(os.path.join(fixtures_dir, filename), "rb") as file:
+                fixtures[beatmap_id] = file.read()
+
+    if not fixtures:
+        raise ValueError(f"No .osz files named after a beatmap set id found in '{fixtures_dir}'")
+
+    return fixtures
+
+
+class FakeMirror:
+    """Local stand-in beatmap mirror serving fixtures at /d/{beatmap_id}."""
+
+    def __init__(
+        self,
+        fixtures: Dict[str, bytes],
+        latency: float = 0,
+        bandwidth: float = 0,
+        failure_rate: float = 0,
+        failure_status: int = 500,
+    ):
+        """Create a new stand-in mirror.
+
+        Args:
+            fixtures: Dictionary of beatmap set id to .osz content
+            latency: Delay before answering, in milliseconds
+            bandwidth: Bandwidth per download, in KiB/s, or 0 for unlimited
+            failure_rate: Fraction of requests that fail, between 0 and 1
+            failure_status: HTTP status of failed requests (e.g. 500 or 429), or 0 to
+                drop the connection without answering
+        """
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                time.sleep(latency / 1000)
+
+                if random.random() < failure_rate:
+                    if failure_status:
+                        self.send_error(failure_status)
+                    else:
+                        self.close_connection = True
+                        self.connection.shutdown(socket.SHUT_RDWR)
+                    return
+
+                data = fixtures.get(self.path.rstrip("/").rsplit("/", 1)[-1])
+                if data is None or not self.path.startswith("/d/"):
+                    self.send_error(404)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+
+                try:
+                    for start in range(0, len(data), MIRROR_CHUNK_SIZE):
+                        self.wfile.write(data[start : start + MIRROR_CHUNK_SIZE])
+                        if bandwidth:
+                            time.sleep(MIRROR_CHUNK_SIZE / (bandwidth * 1024))
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client aborted the download, e.g. another mirror won a race
+                    self.close_connection = True
+                    logger.debug(f"Mirror: client disconnected from {self.path}")
+
+            def log_message(self, format, *args):
+                logger.debug(f"Mirror: {format % args}")
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url_template = f"http://127.0.0.1:{self.server.server_port}/d/{{beatmap_id}}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self) -> "FakeMirror":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _free_port() -> int:
+    """Get a free local TCP port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _process_tree_rss(pid: int) -> Optional[int]:
+    """Get the resident memory of a process and its descendants, in bytes (Linux only)."""
+    children: Dict[int, List[int]] = {}
+    try:
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat", "r") as file:
+                    # The process name may contain spaces, the parent pid follows it
+                    ppid = int(file.read().rsplit(")", 1)[1].split()[1])
+                children.setdefault(ppid, []).append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    except OSError:
+        return None
+
+    total = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        stack.extend(children.get(current, []))
+        try:
+            with open(f"/proc/{current}/status", "r") as file:
+                for line in file:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+
+    return total
+
+
+def _disk_usage(path: str) -> int:
+    """Get the total size of the files under a directory, in bytes."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for filename in files:
+            try:
+                total += os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                continue
+    return total
+
+
+class AppServer:
+    """The web application running in a subprocess, with resource usage sampling."""
+
+    def __init__(self, server_command: str, mirror_url: str, work_dir: str):
+        """Create a new application server.
+
+        Args:
+            server_command: Command starting the application, with {port} placeholder
+            mirror_url: Mirror URL template the application downloads beatmaps from
+            work_dir: Directory for the temporary and upload folders of the application
+        """
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.command = shlex.split(server_command.format(port=self.port))
+        self.work_dir = work_dir
+        self.peak_rss: Optional[int] = None
+        self.peak_disk = 0
+
+        self.env = dict(os.environ)
+        self.env.pop("VERCEL", None)
+        self.env.update(
+            {
+                "BEATMAP_MIRRORS": mirror_url,
+                "UPLOAD_FOLDER": os.path.join(work_dir, "uploads"),
+                "TMPDIR": os.path.join(work_dir, "tmp"),
+                "SECRET_KEY": "loadtest",
+            }
+        )
+        self._process = None
+        self._log_file = None
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+
+    def __enter__(self) -> "AppServer":
+        os.makedirs(self.env["UPLOAD_FOLDER"], exist_ok=True)
+        os.makedirs(self.env["TMPDIR"], exist_ok=True)
+
+        # Keep the application log out of the measured folders
+        self._log_file = open(os.path.join(self.work_dir, "app.log"), "wb")
+        self._process = subprocess.Popen(
+            self.command,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=self.env,
+            stdout=self._log_file,
+            stderr=subprocess.STDOUT,
+        )
+
+        deadline = time.time() + SERVER_START_TIMEOUT
+        while True:
+            if self._process.poll() is not None:
+                raise RuntimeError(f"Application exited on startup, see {self._log_file.name}")
+            try:
+                if requests.get(self.url, timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            if time.time() > deadline:
+                self.__exit__()
+                raise RuntimeError(f"Application did not start within {SERVER_START_TIMEOUT}s")
+            time.sleep(SAMPLE_INTERVAL)
+
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        if self._sampler.is_alive():
+            self._sampler.join()
+        if self._process and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+        if self._log_file:
+            self._log_file.close()
+
+    def _sample(self) -> None:
+        """Record the peak memory and disk usage of the application until stopped."""
+        while True:
+            rss = _process_tree_rss(self._process.pid)
+            if rss is not None:
+                self.peak_rss = max(self.peak_rss or 0, rss)
+            disk = _disk_usage(self.env["UPLOAD_FOLDER"]) + _disk_usage(self.env["TMPDIR"])
+            self.peak_disk = max(self.peak_disk, disk)
+            if self._stop.wait(SAMPLE_INTERVAL):
+                break
+
+
+def run_flow(base_url: str, beatmap_id: str) -> List[Tuple[str, float, bool]]:
+    """Convert a beatmap and download its chart and audio, like a user would.
+
+    Args:
+        base_url: URL of the application
+        beatmap_id: Beatmap set id to convert
+
+    Returns:
+        List of (endpoint, latency in seconds, success) for each request
+    """
+    results = []
+    with requests.Session() as http:
+        steps = [
+            ("/convert", "post", {"beatmap_url": f"https://osu.ppy.sh/beatmapsets/{beatmap_id}"}),
+            ("/download_chart", "get", None),
+            ("/download_audio", "get", None),
+        ]
+        for endpoint, method, data in steps:
+            start = time.perf_counter()
+            try:
+                # Errors are reported by redirecting to the index page with a message
+                response = http.request(
+                    method, base_url + endpoint, data=data, allow_redirects=False, timeout=REQUEST_TIMEOUT
+                )
+                # Read the whole body, as a browser downloading the file would
+                response.content
+                success = response.status_code == 200
+            except requests.RequestException as e:
+                logger.debug(f"Request to {endpoint} failed: {str(e)}")
+                success = False
+            results.append((endpoint, time.perf_counter() - start, success))
+
+            if not success:
+                # The downloads depend on a successful conversion
+                break
+
+    return results
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Get a percentile of a list of values, using the nearest-rank method.
+
+    Args:
+        values: Values to compute the percentile of
+        fraction: Percentile between 0 and 1
+
+    Returns:
+        The percentile, or 0 for an empty list
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(fraction * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def run_level(concurrency: int, args: argparse.Namespace, mirror: FakeMirror, beatmap_ids: List[str]) -> Dict:
+    """Run the load test at one concurrency level against a fresh application.
+
+    Args:
+        concurrency: Number of concurrent users
+        args: Parsed command line arguments
+        mirror: Running stand-in mirror
+        beatmap_ids: Beatmap set ids served by the mirror
+
+    Returns:
+        Dictionary of results for this level
+    """
+    with tempfile.TemporaryDirectory(prefix="loadtest-") as work_dir:
+        with AppServer(args.server_command, mirror.url_template, work_dir) as server:
+
+            def user(index: int) -> List[Tuple[str, float, bool]]:
+                rng = random.Random(index)
+                results = []
+                for _ in range(args.flows_per_user):
+                    results.extend(run_flow(server.url, rng.choice(beatmap_ids)))
+                return results
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = [result for user_results in executor.map(user, range(concurrency)) for result in user_results]
+            elapsed = time.perf_counter() - start
+
+        latencies = [latency for _, latency, success in results if success]
+        endpoints = {}
+        for endpoint in sorted({result[0] for result in results}):
+            endpoint_latencies = [latency for name, latency, success in results if name == endpoint and success]
+            endpoints[endpoint] = {
+                "p50": percentile(endpoint_latencies, 0.50) * 1000,
+                "p99": percentile(endpoint_latencies, 0.99) * 1000,
+            }
+
+        return {
+            "concurrency": concurrency,
+            "requests": len(results),
+            "errors": sum(1 for result in results if not result[2]),
+            "throughput": len(latencies) / elapsed if elapsed else 0.0,
+            "p50": percentile(latencies, 0.50) * 1000,
+            "p95": percentile(latencies, 0.95) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "peak_rss": server.peak_rss,
+            "peak_disk": server.peak_disk,
+            "endpoints": endpoints,
+        }
+
+
+def print_report(levels: List[Dict]) -> None:
+    """Print the results of every concurrency level as a table.
+
+    Args:
+        levels: Results of each level, as returned by run_level
+    """
+    print(
+        f"{'users':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7} "
+        f"{'RSS MiB':>8} {'disk MiB':>9}"
+    )
+    for level in levels:
+        rss = f"{level['peak_rss'] / 1024 / 1024:.1f}" if level["peak_rss"] is not None else "n/a"
+        print(
+            f"{level['concurrency']:>5} {level['throughput']:>8.2f} {level['p50']:>9.1f} {level['p95']:>9.1f} "
+            f"{level['p99']:>9.1f} {level['errors']:>7} {rss:>8} {level['peak_disk'] / 1024 / 1024:>9.1f}"
+        )
+
+
+def main() -> None:
+    """Main function to run the load test."""
+    args = setup_parser()
+    setup_logging(args.debug)
+
+    levels = [int(level) for level in args.levels.split(",") if level.strip()]
+    fixtures = load_fixtures(args.fixtures_dir, args.fixture_count, args.audio_size)
+    beatmap_ids = list(fixtures)
+    logger.info(f"Serving {len(fixtures)} beatmap(s) from the stand-in mirror")
+
+    results = []
+    with FakeMirror(
+        fixtures, args.mirror_latency, args.mirror_bandwidth, args.mirror_failure_rate, args.mirror_failure_status
+    ) as mirror:
+        for concurrency in levels:
+            logger.info(f"Running {concurrency} concurrent user(s)")
+            results.append(run_level(concurrency, args, mirror, beatmap_ids))
+
+    print_report(results)
+
+    if args.output_file:
+        with open(args.output_file, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+        logger.info(f"Results saved to {args.output_file}")
+
+    if args.fail_p99 is not None and any(level["p99"] > args.fail_p99 for level in results):
+        logger.error(f"p99 latency exceeded {args.fail_p99} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        logger.error(f"Error: {str(e)}")
+        sys.exit(1)
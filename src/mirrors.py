@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""
+Beatmap to Chart Converter - Beatmap Mirrors
+
+This module downloads beatmaps from a list of mirrors, trying them in order of
+observed performance. Each mirror keeps rolling speed and error statistics, and
+mirrors that keep failing are skipped for a while (circuit breaker) instead of
+costing every request a timeout.
+"""
+
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Constants
+DEFAULT_MIRRORS = (
+    "https://api.nerinyan.moe/d/{beatmap_id}",
+    "https://beatconnect.io/b/{beatmap_id}",
+)
+CONNECT_TIMEOUT = 5  # seconds
+READ_TIMEOUT = 30  # seconds, between two reads
+DOWNLOAD_TIMEOUT = 120  # seconds for a whole download, over every mirror tried
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+LATENCY_SMOOTHING = 0.3  # weight of the latest sample in the rolling averages
+REFERENCE_DOWNLOAD_SIZE = 20 * 1024 * 1024  # typical beatmap set size the transfer time is scored for
+MIN_THROUGHPUT_SAMPLE_SIZE = 256 * 1024  # smaller bodies don't give a throughput sample
+ERROR_PENALTY = 10  # seconds added to the score for a 100% error rate
+MISS_PENALTY = 5  # seconds added to the score when the mirror never has the beatmap
+ERROR_HALF_LIFE = 60  # seconds for the error rate to halve without new samples
+PROBE_INTERVAL = 300  # seconds without samples after which a mirror is tried first again
+FAILURE_THRESHOLD = 3  # consecutive failures before the circuit opens
+CIRCUIT_OPEN_SECONDS = 60
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class Mirror:
+    """A beatmap mirror and its rolling health statistics."""
+
+    def __init__(self, url_template: str):
+        """Create a new mirror.
+
+        Args:
+            url_template: Download URL, with {beatmap_id} in place of the beatmap set id
+        """
+        self.url_template = url_template
+        self.ttfb: Optional[float] = None
+        self.throughput: Optional[float] = None
+        self.error_rate = 0.0
+        self.miss_rate = 0.0
+        self.last_sample: Optional[float] = None
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+
+    def url(self, beatmap_id: str) -> str:
+        """Get the download URL of a beatmap set on this mirror."""
+        return self.url_template.format(beatmap_id=beatmap_id)
+
+    def is_open(self, now: float) -> bool:
+        """Whether the circuit is open, meaning the mirror should not be tried."""
+        return now < self.open_until
+
+    def _decay(self, now: float) -> float:
+        """Factor to apply to the error and miss rates for the time elapsed since the last sample.
+
+        A demoted mirror isn't tried while the others answer, so without decay a
+        single transient error would penalize it forever.
+        """
+        if self.last_sample is None:
+            return 1.0
+        return 0.5 ** ((now - self.last_sample) / ERROR_HALF_LIFE)
+
+    def current_error_rate(self, now: float) -> float:
+        """Error rate, decayed by the time elapsed since the last sample."""
+        return self.error_rate * self._decay(now)
+
+    def current_miss_rate(self, now: float) -> float:
+        """Rate of answers saying the beatmap isn't available, decayed like the error rate."""
+        return self.miss_rate * self._decay(now)
+
+    def score(self, now: float) -> float:
+        """Expected cost of trying this mirror, in seconds (lower is better).
+
+        The cost is the time to first byte plus the transfer time of a typical
+        beatmap set at the observed throughput, so mirrors are compared on speed
+        regardless of the size of the beatmaps they happened to serve. Errors, and
+        answers without the beatmap, are penalized as they require another mirror.
+        Mirrors without any sample yet, or none for PROBE_INTERVAL, score 0 so they
+        get measured again.
+        """
+        if self.last_sample is None or now - self.last_sample > PROBE_INTERVAL:
+            return 0.0
+        transfer_time = REFERENCE_DOWNLOAD_SIZE / self.throughput if self.throughput else 0.0
+        return (
+            (self.ttfb or 0.0)
+            + transfer_time
+            + self.current_error_rate(now) * ERROR_PENALTY
+            + self.current_miss_rate(now) * MISS_PENALTY
+        )
+
+    def record_success(self, ttfb: float, size: int, duration: float, now: float) -> None:
+        """Record a successful download and close the circuit.
+
+        Args:
+            ttfb: Seconds until the response headers were received
+            size: Size of the response body in bytes
+            duration: Seconds until the whole body was received
+            now: Current time
+        """
+        self.ttfb = _smooth(self.ttfb, ttfb)
+        # Small bodies mostly measure the round trip, not the bandwidth
+        if size >= MIN_THROUGHPUT_SAMPLE_SIZE:
+            self.throughput = _smooth(self.throughput, size / max(duration - ttfb, 1e-3))
+        self._record_answer(now, missing=False)
+
+    def record_miss(self, now: float) -> None:
+        """Record an answer saying the beatmap isn't available.
+
+        The mirror is healthy, but no speed sample is recorded as the answer says
+        nothing about how fast a beatmap download would be.
+        """
+        self._record_answer(now, missing=True)
+
+    def record_failure(self, now: float) -> None:
+        """Record a failed request, opening the circuit after repeated failures."""
+        decay = self._decay(now)
+        error_rate = self.error_rate * decay
+        self.error_rate = error_rate + LATENCY_SMOOTHING * (1.0 - error_rate)
+        self.miss_rate *= decay
+        self.last_sample = now
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= FAILURE_THRESHOLD:
+            # Half-open after the delay: a single new failure reopens the circuit
+            self.open_until = now + CIRCUIT_OPEN_SECONDS
+            logger.warning(f"Mirror {self.url_template} is failing, skipping it for {CIRCUIT_OPEN_SECONDS}s")
+
+    def _record_answer(self, now: float, missing: bool) -> None:
+        decay = self._decay(now)
+        self.error_rate = self.error_rate * decay * (1.0 - LATENCY_SMOOTHING)
+        miss_rate = self.miss_rate * decay
+        self.miss_rate = miss_rate + LATENCY_SMOOTHING * (float(missing) - miss_rate)
+        self.last_sample = now
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+
+
+def _smooth(average: Optional[float], sample: float) -> float:
+    """Update a rolling average with a new sample."""
+    if average is None:
+        return sample
+    return average + LATENCY_SMOOTHING * (sample - average)
+
+
+class _AbortableAdapter(HTTPAdapter):
+    """HTTP adapter that can abort its in-flight requests from another thread.
+
+    The connections it opens are remembered, so their sockets can be shut down,
+    which interrupts a request still waiting for response headers or body data.
+    """
+
+    def __init__(self):
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        super().__init__()
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+
+        adapter = self
+        pool_classes = {}
+        for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items():
+
+            class TrackedConnection(pool_class.ConnectionCls):
+                def connect(self):
+                    super().connect()
+                    with adapter._connections_lock:
+                        adapter._connections.append(self)
+
+            pool_classes[scheme] = type(pool_class.__name__, (pool_class,), {"ConnectionCls": TrackedConnection})
+
+        # Replace the mapping rather than mutating it, it is shared with other pool managers
+        self.poolmanager.pool_classes_by_scheme = pool_classes
+
+    def abort(self) -> None:
+        """Shut down the sockets of every connection opened by this adapter."""
+        with self._connections_lock:
+            connections = list(self._connections)
+        for connection in connections:
+            sock = getattr(connection, "sock", None)
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+
+class MirrorManager:
+    """Download beatmaps from the mirror that is currently performing best."""
+
+    def __init__(self, url_templates: List[str], race: bool = False):
+        """Create a new mirror manager.
+
+        Args:
+            url_templates: Download URLs of the mirrors, with {beatmap_id} placeholders,
+                in order of preference when there are no statistics yet
+            race: Whether to download from the two best mirrors at the same time, keep
+                the first successful response and abort the other download
+        """
+        self.mirrors = [Mirror(url_template) for url_template in url_templates]
+        self.race = race
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_environment(cls) -> "MirrorManager":
+        """Create a mirror manager configured by environment variables.
+
+        BEATMAP_MIRRORS is a comma-separated list of mirror URLs with {beatmap_id}
+        placeholders, and MIRROR_RACE enables racing the two best mirrors.
+        """
+        mirrors = os.environ.get("BEATMAP_MIRRORS", "")
+        url_templates = [url.strip() for url in mirrors.split(",") if url.strip()] or list(DEFAULT_MIRRORS)
+        race = os.environ.get("MIRROR_RACE", "").lower() in ("1", "true", "yes")
+        return cls(url_templates, race=race)
+
+    def ordered(self) -> List[Mirror]:
+        """Get the mirrors in the order they should be tried.
+
+        Mirrors with an open circuit are left out, unless all of them are open.
+        """
+        now = time.time()
+        with self._lock:
+            ranked = sorted(self.mirrors, key=lambda mirror: mirror.score(now))
+            available = [mirror for mirror in ranked if not mirror.is_open(now)]
+        return available or ranked
+
+    def stats(self) -> List[Dict]:
+        """Get the current statistics of every mirror, for logging and debugging."""
+        now = time.time()
+        with self._lock:
+            return [
+                {
+                    "url": mirror.url_template,
+                    "ttfb": mirror.ttfb,
+                    "throughput": mirror.throughput,
+                    "error_rate": round(mirror.current_error_rate(now), 3),
+                    "miss_rate": round(mirror.current_miss_rate(now), 3),
+                    "circuit_open": mirror.is_open(now),
+                }
+                for mirror in self.mirrors
+            ]
+
+    def download(self, beatmap_id: str, headers: Optional[Dict[str, str]] = None) -> requests.Response:
+        """Download a beatmap set from the best available mirror.
+
+        Args:
+            beatmap_id: The beatmap set id
+            headers: HTTP headers to send with the request
+
+        Returns:
+            The first response with status 200, or otherwise the most meaningful
+            failed response (a 404 from any mirror is preferred over server errors)
+
+        Raises:
+            requests.RequestException: If every mirror failed without a response
+            requests.Timeout: If DOWNLOAD_TIMEOUT passed before any mirror answered
+        """
+        deadline = time.perf_counter() + DOWNLOAD_TIMEOUT
+        mirrors = self.ordered()
+        last_response = None
+        last_error = None
+
+        if self.race and len(mirrors) > 1:
+            response, last_response, last_error = self._race(mirrors[:2], beatmap_id, headers, deadline)
+            if response is not None:
+                return response
+            mirrors = mirrors[2:]
+
+        for mirror in mirrors:
+            if time.perf_counter() >= deadline:
+                last_error = requests.Timeout(f"Download of beatmap {beatmap_id} exceeded {DOWNLOAD_TIMEOUT}s")
+                break
+            try:
+                response = self._fetch(mirror, beatmap_id, headers, deadline)
+            except requests.RequestException as e:
+                last_error = e
+                continue
+
+            if response.status_code == 200:
+                if last_response is not None:
+                    last_response.close()
+                return response
+
+            logger.info(f"Beatmap not available at {mirror.url(beatmap_id)} (status {response.status_code})")
+            last_response = _keep_response(last_response, response)
+
+        if last_response is not None:
+            return last_response
+        raise last_error or requests.RequestException("No beatmap mirror available")
+
+    def _fetch(
+        self,
+        mirror: Mirror,
+        beatmap_id: str,
+        headers: Optional[Dict[str, str]],
+        deadline: float,
+        http=requests,
+        cancelled: Optional[threading.Event] = None,
+    ) -> Optional[requests.Response]:
+        """Download a beatmap from a mirror and record the outcome in its statistics.
+
+        The body is read here, so both the time to first byte and the throughput of the
+        mirror are measured, and a mirror that answers quickly but transfers slowly
+        doesn't look like the best one.
+
+        Args:
+            mirror: The mirror to download from
+            beatmap_id: The beatmap set id
+            headers: HTTP headers to send with the request
+            deadline: time.perf_counter() value the body must be received by, as the
+                read timeout only bounds the wait for each chunk
+            http: Session (or the requests module) to send the request with
+            cancelled: Event aborting the download when set, checked between body chunks
+
+        Returns:
+            The response with its body loaded, or None if the download was cancelled
+
+        Raises:
+            requests.RequestException: If the download failed or didn't finish before the deadline
+        """
+        url = mirror.url(beatmap_id)
+        logger.info(f"Downloading beatmap from {url}")
+
+        start = time.perf_counter()
+        try:
+            response = http.get(url, headers=headers, stream=True, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+            ttfb = time.perf_counter() - start
+            chunks = []
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                if cancelled is not None and cancelled.is_set():
+                    response.close()
+                    logger.debug(f"Cancelled download from {url}")
+                    return None
+                if time.perf_counter() > deadline:
+                    response.close()
+                    raise requests.Timeout(f"Download from {url} exceeded {DOWNLOAD_TIMEOUT}s")
+                chunks.append(chunk)
+            # Same as what reading response.content does, but interruptible
+            response._content = b"".join(chunks)
+            response._content_consumed = True
+        except requests.RequestException as e:
+            if cancelled is not None and cancelled.is_set():
+                # The connection was closed because another mirror won the race
+                return None
+            logger.warning(f"Failed to download beatmap from {url}: {str(e)}")
+            with self._lock:
+                mirror.record_failure(time.time())
+            raise
+
+        duration = time.perf_counter() - start
+        with self._lock:
+            # Only full downloads measure speed; a missing beatmap is still a healthy answer
+            if response.status_code == 200:
+                mirror.record_success(ttfb, len(response.content), duration, time.time())
+            elif response.status_code >= 500 or response.status_code == 429:
+                mirror.record_failure(time.time())
+            else:
+                mirror.record_miss(time.time())
+
+        return response
+
+    def _race(self, mirrors: List[Mirror], beatmap_id: str, headers: Optional[Dict[str, str]], deadline: float):
+        """Download from several mirrors at once and keep the first successful response.
+
+        Each mirror gets its own thread and session, so races never queue behind each
+        other. Once a winner is found, the connections of the other sessions are shut
+        down, which aborts their downloads whether they are still waiting for headers
+        or reading the body, and no sample is recorded for them. The same happens to
+        every racer when the deadline passes.
+
+        Returns:
+            Tuple of (winning response or None, last other response or None, last error or None)
+        """
+        results: "queue.Queue" = queue.Queue()
+        cancelled = threading.Event()
+        adapters = [_AbortableAdapter() for _ in mirrors]
+        sessions = []
+        for adapter in adapters:
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            sessions.append(session)
+
+        def run(mirror: Mirror, session: requests.Session) -> None:
+            try:
+                results.put((mirror, self._fetch(mirror, beatmap_id, headers, deadline, session, cancelled)))
+            except requests.RequestException as e:
+                results.put((mirror, e))
+            except Exception as e:
+                logger.error(f"Unexpected error downloading from {mirror.url(beatmap_id)}: {str(e)}")
+                results.put((mirror, requests.RequestException(str(e))))
+
+        for mirror, session in zip(mirrors, sessions):
+            threading.Thread(target=run, args=(mirror, session), daemon=True, name="mirror-race").start()
+
+        winner = None
+        last_response = None
+        last_error = None
+        pending = list(mirrors)
+
+        while pending:
+            try:
+                # A racer still waiting for headers only checks the deadline once they arrive
+                mirror, result = results.get(timeout=max(deadline - time.perf_counter(), 0))
+            except queue.Empty:
+                last_error = requests.Timeout(f"Download of beatmap {beatmap_id} exceeded {DOWNLOAD_TIMEOUT}s")
+                with self._lock:
+                    for mirror in pending:
+                        mirror.record_failure(time.time())
+                break
+            pending.remove(mirror)
+            if isinstance(result, requests.RequestException):
+                last_error = result
+            elif result is not None and result.status_code == 200:
+                winner = result
+                break
+            elif result is not None:
+                last_response = _keep_response(last_response, result)
+
+        # Abort the losers by closing their connections; the winner's body is already loaded
+        cancelled.set()
+        for adapter, session in zip(adapters, sessions):
+            adapter.abort()
+            session.close()
+
+        if winner is not None and last_response is not None:
+            last_response.close()
+            last_response = None
+
+        return winner, last_response, last_error
+
+
+def _keep_response(kept: Optional[requests.Response], new: requests.Response) -> requests.Response:
+    """Choose which of two failed responses to report, and close the other one.
+
+    A mirror answering 404 means the beatmap doesn't exist, which is more useful to
+    report than another mirror's server error.
+    """
+    if kept is not None and kept.status_code == 404 and new.status_code != 404:
+        new.close()
+        return kept
+    if kept is not None:
+        kept.close()
+    return new
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Beatmap to Chart Converter - Profiling
+
+This module measures the wall time, CPU time and peak allocated memory of each
+stage of a conversion, to investigate slow conversions of specific beatmaps.
+"""
+
+import cProfile
+import logging
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, TextIO, Tuple
+
+# Constants
+DEFAULT_TOP_ALLOCATIONS = 10
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class StageProfiler:
+    """Record per-stage timings and memory usage of a conversion.
+
+    When disabled, stage() does nothing, so the conversion code can be wrapped
+    unconditionally.
+    """
+
+    def __init__(self, enabled: bool = False, stats_file: Optional[str] = None, top_allocations: int = 0):
+        """Create a new stage profiler.
+
+        Args:
+            enabled: Whether to record anything at all
+            stats_file: Path to dump cProfile statistics to (.pstats), or None
+            top_allocations: Number of top allocation sites to report, or 0 to disable
+        """
+        self.enabled = enabled
+        self.stats_file = stats_file
+        self.top_allocations = top_allocations
+        # (stage, wall seconds, cpu seconds, peak bytes)
+        self.results: List[Tuple[str, float, float, int]] = []
+        # Peak traced memory of the whole run, stages reset the tracemalloc peak
+        self.peak_memory = 0
+        self._profile = None
+        self._snapshot = None
+
+    def start(self) -> None:
+        """Start tracing memory allocations and, if requested, cProfile."""
+        if not self.enabled:
+            return
+
+        tracemalloc.start()
+        if self.stats_file:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self) -> None:
+        """Stop profiling, dump the cProfile statistics and take the allocation snapshot."""
+        if not self.enabled:
+            return
+
+        self._update_peak()
+        if self._profile:
+            self._profile.disable()
+            self._profile.dump_stats(self.stats_file)
+            logger.info(f"Profile statistics saved to {self.stats_file}")
+
+        if self.top_allocations:
+            # Leave out allocations made by the profiling tools themselves
+            self._snapshot = tracemalloc.take_snapshot().filter_traces(
+                [
+                    tracemalloc.Filter(False, cProfile.__file__),
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                    tracemalloc.Filter(False, __file__),
+                ]
+            )
+        tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Measure a stage of the conversion.
+
+        Args:
+            name: Name of the stage, shown in the report
+        """
+        if not self.enabled:
+            yield
+            return
+
+        self._update_peak()
+        start_memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start_wall
+            cpu = time.process_time() - start_cpu
+            _, peak_memory = tracemalloc.get_traced_memory()
+            self.peak_memory = max(self.peak_memory, peak_memory)
+            self.results.append((name, wall, cpu, max(peak_memory - start_memory, 0)))
+
+    def _update_peak(self) -> None:
+        """Fold the traced memory peak since the last reset into the whole-run peak."""
+        self.peak_memory = max(self.peak_memory, tracemalloc.get_traced_memory()[1])
+
+    def report(self, stream: TextIO = sys.stderr) -> None:
+        """Print the stage table and the top allocation sites.
+
+        Args:
+            stream: Stream to print the report to (default: stderr, to keep stdout for the output)
+        """
+        if not self.enabled:
+            return
+
+        print(f"{'stage':<10} {'wall ms':>10} {'cpu ms':>10} {'peak KiB':>10}", file=stream)
+        for name, wall, cpu, peak in self.results:
+            print(f"{name:<10} {wall * 1000:>10.3f} {cpu * 1000:>10.3f} {peak / 1024:>10.1f}", file=stream)
+
+        total_wall = sum(result[1] for result in self.results)
+        total_cpu = sum(result[2] for result in self.results)
+        print(
+            f"{'total':<10} {total_wall * 1000:>10.3f} {total_cpu * 1000:>10.3f} {self.peak_memory / 1024:>10.1f}",
+            file=stream,
+        )
+
+        if self._snapshot:
+            print(f"\nTop {self.top_allocations} allocation sites:", file=stream)
+            for stat in self._snapshot.statistics("lineno")[: self.top_allocations]:
+                print(f"  {stat}", file=stream)
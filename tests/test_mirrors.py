@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Beatmap to Chart Converter - Mirror Tests
+
+Checks the mirror manager against local stand-in mirrors that are slow or failing.
+Run from the repository root with: python -m unittest discover tests
+"""
+
+import logging
+import os
+import sys
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from unittest import mock
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import mirrors  # noqa: E402
+from loadtest import FakeMirror, generate_fixture  # noqa: E402
+from mirrors import FAILURE_THRESHOLD, Mirror, MirrorManager  # noqa: E402
+
+# Constants
+BEATMAP_ID = "1"
+FIXTURE_SIZE_MB = 0.3
+
+
+def setUpModule() -> None:
+    # The failures below are expected, keep them out of the test output
+    logging.getLogger("mirrors").setLevel(logging.CRITICAL)
+
+
+def tearDownModule() -> None:
+    logging.getLogger("mirrors").setLevel(logging.NOTSET)
+
+
+class MirrorManagerTest(unittest.TestCase):
+    """Fallback, circuit breaking, ordering and racing against stand-in mirrors."""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.fixtures = {BEATMAP_ID: generate_fixture(FIXTURE_SIZE_MB)}
+
+    def setUp(self) -> None:
+        self.stack = ExitStack()
+        self.addCleanup(self.stack.close)
+
+    def start_mirror(self, **options) -> str:
+        """Start a stand-in mirror for the duration of the test and get its URL template."""
+        return self.stack.enter_context(FakeMirror(self.fixtures, **options)).url_template
+
+    def test_falls_back_from_server_errors(self):
+        manager = MirrorManager([self.start_mirror(failure_rate=1, failure_status=500), self.start_mirror()])
+
+        response = manager.download(BEATMAP_ID)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.fixtures[BEATMAP_ID])
+
+    def test_falls_back_from_dropped_connections(self):
+        manager = MirrorManager([self.start_mirror(failure_rate=1, failure_status=0), self.start_mirror()])
+
+        response = manager.download(BEATMAP_ID)
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_reports_missing_beatmap_over_server_errors(self):
+        manager = MirrorManager([self.start_mirror(), self.start_mirror(failure_rate=1, failure_status=500)])
+
+        response = manager.download("2")
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_raises_when_every_mirror_drops_the_connection(self):
+        manager = MirrorManager([self.start_mirror(failure_rate=1, failure_status=0)])
+
+        with self.assertRaises(requests.RequestException):
+            manager.download(BEATMAP_ID)
+
+    def test_opens_the_circuit_of_failing_mirrors(self):
+        manager = MirrorManager(
+            [
+                self.start_mirror(failure_rate=1, failure_status=500),
+                self.start_mirror(failure_rate=1, failure_status=429),
+                self.start_mirror(failure_rate=1, failure_status=0),
+            ]
+        )
+
+        with self.assertLogs("mirrors", logging.WARNING) as logs:
+            for _ in range(FAILURE_THRESHOLD):
+                try:
+                    manager.download(BEATMAP_ID)
+                except requests.RequestException:
+                    pass
+
+        self.assertEqual([stats["circuit_open"] for stats in manager.stats()], [True, True, True])
+        self.assertEqual(sum("is failing" in line for line in logs.output), 3)
+
+    def test_tries_the_fastest_mirror_first(self):
+        fast = self.start_mirror(latency=20)
+        manager = MirrorManager([self.start_mirror(latency=300), fast])
+        for _ in range(2):
+            manager.download(BEATMAP_ID)
+
+        self.assertEqual(manager.ordered()[0].url_template, fast)
+
+    def test_prefers_fast_transfers_over_fast_answers(self):
+        throttled = self.start_mirror(bandwidth=1024)
+        fast = self.start_mirror(latency=100)
+        manager = MirrorManager([throttled, fast])
+        for _ in range(2):
+            manager.download(BEATMAP_ID)
+
+        self.assertEqual(manager.ordered()[0].url_template, fast)
+
+    def test_mirror_without_the_beatmap_does_not_stay_first(self):
+        missing = self.stack.enter_context(FakeMirror({})).url_template
+        manager = MirrorManager([missing, self.start_mirror(latency=50)])
+        for _ in range(3):
+            manager.download(BEATMAP_ID)
+
+        stats = manager.stats()
+        self.assertIsNone(stats[0]["ttfb"])
+        self.assertFalse(stats[0]["circuit_open"])
+        self.assertNotEqual(manager.ordered()[0].url_template, missing)
+
+    def test_races_without_waiting_for_the_slow_mirror(self):
+        manager = MirrorManager([self.start_mirror(latency=3000), self.start_mirror(latency=20)], race=True)
+
+        def timed_download(_) -> float:
+            start = time.perf_counter()
+            self.assertEqual(manager.download(BEATMAP_ID).status_code, 200)
+            return time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            durations = list(executor.map(timed_download, range(8)))
+
+        self.assertLess(max(durations), 1)
+
+    def test_aborts_downloads_past_the_deadline(self):
+        # 64 KiB/s sends one chunk per second
+        slow = self.start_mirror(bandwidth=64)
+        for race in (False, True):
+            with self.subTest(race=race), mock.patch.object(mirrors, "DOWNLOAD_TIMEOUT", 0.3):
+                manager = MirrorManager([slow, self.start_mirror(latency=3000)], race=race)
+                start = time.perf_counter()
+
+                with self.assertRaises(requests.Timeout):
+                    manager.download(BEATMAP_ID)
+
+                self.assertLess(time.perf_counter() - start, 2)
+                self.assertGreater(manager.stats()[0]["error_rate"], 0)
+
+
+class MirrorScoreTest(unittest.TestCase):
+    """Scoring of mirrors from their recorded samples."""
+
+    def test_score_does_not_depend_on_the_download_size(self):
+        large, small = Mirror("large"), Mirror("small")
+
+        # Same time to first byte and 10 MiB/s for both
+        large.record_success(0.05, 40 * 1024 * 1024, 4.05, now=0)
+        small.record_success(0.05, 2 * 1024 * 1024, 0.25, now=0)
+
+        self.assertAlmostEqual(large.score(0), small.score(0))
+
+    def test_missing_beatmap_is_healthy_without_speed_sample(self):
+        mirror = Mirror("missing")
+        mirror.record_failure(now=0)
+
+        mirror.record_miss(now=0)
+
+        self.assertIsNone(mirror.ttfb)
+        self.assertIsNone(mirror.throughput)
+        self.assertEqual(mirror.consecutive_failures, 0)
+        self.assertLess(mirror.current_error_rate(0), 0.3)
+        self.assertGreater(mirror.current_miss_rate(0), 0)
+
+    def test_error_rate_decays_without_samples(self):
+        mirror = Mirror("flaky")
+        mirror.record_failure(now=0)
+
+        self.assertAlmostEqual(mirror.current_error_rate(mirrors.ERROR_HALF_LIFE), mirror.error_rate / 2)
+
+    def test_stale_mirrors_are_probed_again(self):
+        mirror = Mirror("stale")
+        mirror.record_failure(now=0)
+
+        self.assertGreater(mirror.score(1), 0)
+        self.assertEqual(mirror.score(mirrors.PROBE_INTERVAL + 1), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()